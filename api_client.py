@@ -1,10 +1,37 @@
 import asyncio
+import email.utils
+import os
+import random
+import time
+import aiofiles
 import aiohttp
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    import json as orjson
 
 from config import Config
 from colors import Colors
+from rate_limiter import RateLimiter
+
+RETRY_BASE = 1.0
+RETRY_CAP = 60.0
+CACHE_MAX_SIZE = 128
+
+_SERIES_FIELDS = (
+    "background", "eng_name", "otherNames", "summary", "releaseDate",
+    "type_id", "caution", "views", "close_view", "rate_avg", "rate",
+    "genres", "tags", "teams", "user", "franchise", "authors", "publisher",
+    "userRating", "moderated", "metadata", "metadata.count",
+    "metadata.close_comments", "manga_status_id", "chap_count",
+    "status_id", "artists", "format"
+)
+# aiohttp сериализует список пар как повторяющиеся параметры fields[]=...
+_SERIES_PARAMS = [("fields[]", field) for field in _SERIES_FIELDS]
 
 
 class MangaAPIClient:
@@ -12,8 +39,11 @@ class MangaAPIClient:
     def __init__(self, cfg: Config):
         self.cfg = cfg
         self._session: Optional[aiohttp.ClientSession] = None
-        self._chapters_map: Dict[str, Dict[float, int]] = {}
-        self._series_cache: Dict[str, Dict[str, Any]] = {}
+        self._chapters_map: OrderedDict[str, Dict[float, int]] = OrderedDict()
+        self._series_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self._warmed = False
+        self._limiter = RateLimiter(rate=1 / max(cfg.request_delay, 1e-3))
         self._headers = {
             "User-Agent": "Mozilla/5.0 (iPad; CPU OS 18_6_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/142.0.7444.46 Mobile/15E148 Safari/604.1",
             "Accept": "*/*",
@@ -21,9 +51,19 @@ class MangaAPIClient:
         }
 
     async def __aenter__(self):
-        conn = aiohttp.TCPConnector(limit=self.cfg.max_concurrent_images * 2)
-        self._session = aiohttp.ClientSession(connector=conn, headers=self._headers)
-        await self._warm_up_session()
+        conn = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=max(self.cfg.max_concurrent_images, 16),
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            enable_cleanup_closed=True,
+            keepalive_timeout=75,
+            force_close=False
+        )
+        timeout = aiohttp.ClientTimeout(total=60, sock_connect=10, sock_read=30)
+        self._session = aiohttp.ClientSession(
+            connector=conn, headers=self._headers, timeout=timeout
+        )
         return self
 
     async def __aexit__(self, *args):
@@ -31,17 +71,24 @@ class MangaAPIClient:
             await self._session.close()
 
     async def _warm_up_session(self):
+        if self._warmed:
+            return
+
+        self._warmed = True
         try:
             async with self._session.get(self.cfg.referer, timeout=6):
                 pass
         except Exception:
             pass
 
-    async def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None, 
-                       retries: int = 5) -> Dict[str, Any]:
+    async def _get_json(self, url: str,
+                        params: Optional[Union[Dict[str, Any], List[Tuple[str, str]]]] = None,
+                        retries: int = 5,
+                        retry_client_errors: bool = True) -> Dict[str, Any]:
         for attempt in range(retries):
             try:
-                async with self._session.get(url, params=params, timeout=30) as resp:
+                await self._limiter.acquire()
+                async with self._session.get(url, params=params) as resp:
                     if resp.status == 429:
                         wait = self._calculate_retry_delay(resp.headers, attempt)
                         print(Colors.warning(
@@ -52,8 +99,7 @@ class MangaAPIClient:
                         continue
 
                     resp.raise_for_status()
-                    data = await resp.json()
-                    await asyncio.sleep(self.cfg.request_delay)
+                    data = orjson.loads(await resp.read())
                     return data
 
             except aiohttp.ClientResponseError as e:
@@ -65,7 +111,8 @@ class MangaAPIClient:
                     ))
                     await asyncio.sleep(wait)
                     continue
-                if attempt == retries - 1:
+                # 4xx (кроме 429) окончателен — при проверке томов повторять незачем
+                if attempt == retries - 1 or (not retry_client_errors and 400 <= e.status < 500):
                     raise
                 await asyncio.sleep(0.2 * (attempt + 1))
 
@@ -79,10 +126,60 @@ class MangaAPIClient:
 
     @staticmethod
     def _calculate_retry_delay(headers: Dict[str, str], attempt: int) -> float:
-        retry_after = headers.get("Retry-After")
-        if retry_after and retry_after.isdigit():
-            return float(retry_after) + 1.0
-        return min(2 ** attempt, 60) + 0.1 * attempt
+        delay = MangaAPIClient._parse_retry_after(headers.get("Retry-After"))
+
+        if delay is None:
+            reset = headers.get("X-RateLimit-Reset") or headers.get("X-Rate-Limit-Reset")
+            reset_value = MangaAPIClient._parse_float(reset) if reset else None
+            if reset_value is not None:
+                # Большие значения — это epoch, маленькие — секунды до сброса
+                delay = reset_value - time.time() if reset_value > 1e9 else reset_value
+
+        if delay is None:
+            retry_after_ms = headers.get("Retry-After-Ms")
+            ms_value = MangaAPIClient._parse_float(retry_after_ms) if retry_after_ms else None
+            if ms_value is not None:
+                delay = ms_value / 1000
+
+        if delay is not None:
+            return min(max(delay, 0.0), RETRY_CAP) + random.uniform(0.1, 1.0)
+
+        return min(RETRY_CAP, RETRY_BASE * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+
+        value = value.strip()
+        try:
+            return float(int(value))
+        except ValueError:
+            pass
+
+        try:
+            return float(value)
+        except ValueError:
+            pass
+
+        try:
+            return email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _lru_get(cache: OrderedDict, key: str) -> Optional[Any]:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+    @staticmethod
+    def _lru_set(cache: OrderedDict, key: str, value: Any):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > CACHE_MAX_SIZE:
+            cache.popitem(last=False)
 
     @staticmethod
     def _parse_float(value: str) -> Optional[float]:
@@ -95,87 +192,102 @@ class MangaAPIClient:
                 return None
 
     async def fetch_chapters_list(self, slug: str) -> Dict[float, int]:
-        if slug in self._chapters_map:
-            return self._chapters_map[slug]
+        cached = self._lru_get(self._chapters_map, slug)
+        if cached is not None:
+            return cached
 
         url = f"{self.cfg.api_base}/{slug}/chapters"
+        if url in self._inflight:
+            await self._inflight[url].wait()
+            return self._lru_get(self._chapters_map, slug) or {}
+
+        self._inflight[url] = asyncio.Event()
         mapping: Dict[float, int] = {}
 
         try:
             data = await self._get_json(url, retries=4)
             items = data.get("data", []) if isinstance(data, dict) else []
 
+            parse = self._parse_float
+
             for item in items:
                 chapter_num = item.get("number")
                 volume_num = item.get("volume")
-                
+
                 if chapter_num is None or volume_num is None:
                     continue
 
-                chapter_float = self._parse_float(str(chapter_num))
                 try:
                     volume_int = int(volume_num)
                 except (ValueError, TypeError):
                     continue
 
-                if chapter_float is not None:
-                    mapping[chapter_float] = volume_int
+                # Почти всегда номер уже числовой — str() и замена запятой не нужны
+                try:
+                    mapping[float(chapter_num)] = volume_int
+                except (ValueError, TypeError):
+                    chapter_float = parse(str(chapter_num))
+                    if chapter_float is not None:
+                        mapping[chapter_float] = volume_int
         except Exception:
             mapping = {}
+        finally:
+            self._inflight.pop(url).set()
 
-        self._chapters_map[slug] = mapping
+        self._lru_set(self._chapters_map, slug, mapping)
         return mapping
 
     async def fetch_series_info(self, slug: str) -> Dict[str, Any]:
-        if slug in self._series_cache:
-            return self._series_cache[slug]
+        cached = self._lru_get(self._series_cache, slug)
+        if cached is not None:
+            return cached
 
         url = f"{self.cfg.api_base}/{slug}"
-        fields = [
-            "background", "eng_name", "otherNames", "summary", "releaseDate", 
-            "type_id", "caution", "views", "close_view", "rate_avg", "rate", 
-            "genres", "tags", "teams", "user", "franchise", "authors", "publisher", 
-            "userRating", "moderated", "metadata", "metadata.count", 
-            "metadata.close_comments", "manga_status_id", "chap_count", 
-            "status_id", "artists", "format"
-        ]
-        params = {f"fields[]": field for field in fields}
-        
+
+        if url in self._inflight:
+            await self._inflight[url].wait()
+            return self._lru_get(self._series_cache, slug) or {}
+
+        self._inflight[url] = asyncio.Event()
         try:
-            data = await self._get_json(url, params=params, retries=3)
+            data = await self._get_json(url, params=_SERIES_PARAMS, retries=3)
             result = data.get("data", {}) if isinstance(data, dict) else {}
         except Exception:
             result = {}
+        finally:
+            self._inflight.pop(url).set()
 
-        self._series_cache[slug] = result
+        self._lru_set(self._series_cache, slug, result)
         return result
 
-    async def fetch_chapter_data(self, slug: str, chapter_num: int, 
-                                 volume: int) -> Dict[str, Any]:
+    async def fetch_chapter_data(self, slug: str, chapter_num: int,
+                                 volume: int, retry_client_errors: bool = True) -> Dict[str, Any]:
         url = f"{self.cfg.api_base}/{slug}/chapter"
         return await self._get_json(
             url,
             params={"number": chapter_num, "volume": volume},
-            retries=4
+            retries=4,
+            retry_client_errors=retry_client_errors
         )
 
-    async def resolve_volume(self, slug: str, chapter_num: int) -> int:
+    async def resolve_volume(self, slug: str,
+                             chapter_num: int) -> Tuple[int, Optional[Dict[str, Any]]]:
         if self.cfg.volume_override is not None:
-            return self.cfg.volume_override
+            return self.cfg.volume_override, None
 
         chapters_map = await self.fetch_chapters_list(slug)
         target_chapter = float(chapter_num)
 
         if chapters_map and target_chapter in chapters_map:
-            return chapters_map[target_chapter]
+            return chapters_map[target_chapter], None
 
         series_info = await self.fetch_series_info(slug)
         detected_volume = self._search_volume_in_metadata(series_info, target_chapter)
         
         if detected_volume is not None:
             try:
-                await self.fetch_chapter_data(slug, chapter_num, detected_volume)
-                return detected_volume
+                chapter_json = await self.fetch_chapter_data(slug, chapter_num, detected_volume)
+                return detected_volume, chapter_json
             except Exception:
                 pass
 
@@ -183,11 +295,14 @@ class MangaAPIClient:
 
     def _search_volume_in_metadata(self, metadata: Dict[str, Any], 
                                    target_chapter: float) -> Optional[int]:
-        def search(obj) -> Optional[int]:
+        queue = deque([metadata])
+
+        while queue:
+            obj = queue.popleft()
             if isinstance(obj, dict):
                 num = obj.get("number") or obj.get("chapter_number")
                 vol = obj.get("volume")
-                
+
                 if num is not None and vol is not None:
                     chapter_float = self._parse_float(str(num))
                     if chapter_float == target_chapter:
@@ -195,30 +310,38 @@ class MangaAPIClient:
                             return int(vol)
                         except (ValueError, TypeError):
                             pass
-                
-                for value in obj.values():
-                    result = search(value)
-                    if result is not None:
-                        return result
+
+                queue.extend(obj.values())
             elif isinstance(obj, list):
-                for item in obj:
-                    result = search(item)
-                    if result is not None:
-                        return result
-            return None
+                queue.extend(obj)
 
-        return search(metadata)
+        return None
 
-    async def _bruteforce_volume(self, slug: str, chapter_num: int) -> int:
+    async def _bruteforce_volume(self, slug: str,
+                                 chapter_num: int) -> Tuple[int, Dict[str, Any]]:
         start, end = self.cfg.fallback_volume_range
-        
-        for volume in range(start, end + 1):
-            try:
-                await asyncio.sleep(0.12)
-                await self.fetch_chapter_data(slug, chapter_num, volume)
-                return volume
-            except Exception:
-                continue
+        tasks = {
+            asyncio.create_task(
+                self.fetch_chapter_data(slug, chapter_num, volume, retry_client_errors=False)
+            ): volume
+            for volume in range(start, end + 1)
+        }
+        pending = set(tasks)
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                found = [
+                    (tasks[task], task.result()) for task in done
+                    if not task.cancelled() and task.exception() is None
+                ]
+                if found:
+                    return min(found, key=lambda item: item[0])
+        finally:
+            for task in pending:
+                task.cancel()
 
         raise ValueError(f"Could not determine volume for chapter {chapter_num}")
 
@@ -231,7 +354,8 @@ class MangaAPIClient:
 
         for attempt in range(retries):
             try:
-                async with self._session.get(url, headers=headers, timeout=60) as resp:
+                await self._limiter.acquire()
+                async with self._session.get(url, headers=headers) as resp:
                     if resp.status == 429:
                         wait = self._calculate_retry_delay(resp.headers, attempt)
                         print(Colors.warning(
@@ -251,16 +375,26 @@ class MangaAPIClient:
                         continue
 
                     resp.raise_for_status()
-                    data = await resp.read()
-                    
-                    if not data:
-                        raise RuntimeError("Empty response")
-
-                    dest.parent.mkdir(parents=True, exist_ok=True)
-                    dest.write_bytes(data)
-                    await asyncio.sleep(self.cfg.request_delay)
+
+                    tmp = dest.with_suffix(dest.suffix + ".part")
+                    try:
+                        async with aiofiles.open(tmp, "wb") as f:
+                            async for chunk in resp.content.iter_chunked(65536):
+                                await f.write(chunk)
+
+                        if tmp.stat().st_size == 0:
+                            raise RuntimeError("Empty response")
+
+                        os.replace(tmp, dest)
+                    finally:
+                        if tmp.exists():
+                            tmp.unlink()
                     return
 
+            except FileNotFoundError:
+                # Каталог назначения удалён — повторный запрос не поможет
+                raise
+
             except Exception as e:
                 if attempt == retries - 1:
                     print(Colors.error(f"Image download failed after {retries} attempts: {e}"))
@@ -1,39 +1,55 @@
+import sys
+
+_TTY = sys.stdout.isatty()
+
+
+def _ansi(code: str) -> str:
+    return code if _TTY else ""
+
+
 class Colors:
-    RESET = "\033[0m"
-    BOLD = "\033[1m"
-    GREEN = "\033[92m"
-    BLUE = "\033[94m"
-    YELLOW = "\033[93m"
-    RED = "\033[91m"
-    CYAN = "\033[96m"
-    MAG = "\033[95m"
+    RESET = _ansi("\033[0m")
+    BOLD = _ansi("\033[1m")
+    GREEN = _ansi("\033[92m")
+    BLUE = _ansi("\033[94m")
+    YELLOW = _ansi("\033[93m")
+    RED = _ansi("\033[91m")
+    CYAN = _ansi("\033[96m")
+    MAG = _ansi("\033[95m")
+
+    _SUCCESS = f"{GREEN}Success: {RESET} "
+    _INFO = f"{CYAN}Info: {RESET} "
+    _ERROR = f"{RED}Error: {RESET} "
+    _WARNING = f"{YELLOW}Warning: {RESET} "
+    _CHAPTER = f"{BOLD}{MAG}Chapter "
+    _TITLE = f"{BOLD}{BLUE}"
 
     @staticmethod
     def success(msg: str) -> str:
         """Сообщение об успехе"""
-        return f"{Colors.GREEN}Success: {Colors.RESET} {msg}"
+        return Colors._SUCCESS + msg
 
     @staticmethod
     def info(msg: str) -> str:
         """Информационное сообщение"""
-        return f"{Colors.CYAN}Info: {Colors.RESET} {msg}"
+        return Colors._INFO + msg
 
     @staticmethod
     def error(msg: str) -> str:
         """Сообщение об ошибке"""
-        return f"{Colors.RED}Error: {Colors.RESET} {msg}"
+        return Colors._ERROR + msg
 
     @staticmethod
     def warning(msg: str) -> str:
         """Предупреждение"""
-        return f"{Colors.YELLOW}Warning: {Colors.RESET} {msg}"
+        return Colors._WARNING + msg
 
     @staticmethod
     def chapter(num: int) -> str:
         """Форматированный номер главы"""
-        return f"{Colors.BOLD}{Colors.MAG}Chapter {num}{Colors.RESET}"
+        return f"{Colors._CHAPTER}{num}{Colors.RESET}"
 
     @staticmethod
     def title(text: str) -> str:
         """Форматированный заголовок"""
-        return f"{Colors.BOLD}{Colors.BLUE}{text}{Colors.RESET}"
\ No newline at end of file
+        return Colors._TITLE + text + Colors.RESET
\ No newline at end of file
@@ -18,4 +18,5 @@ class Config:
     api_base: str = "https://api.cdnlibs.org/api/manga"
     image_host: str = "https://img3.mixlib.me"
     referer: str = "https://mangalib.me/"
-    group_by_volume: bool = True
\ No newline at end of file
+    group_by_volume: bool = True
+    emit_series_zip: bool = False
\ No newline at end of file
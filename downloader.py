@@ -1,13 +1,14 @@
 import asyncio
 import json
+import os
 import time
 import re
 import shutil
 import zipfile
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict
 from collections import defaultdict
-from tqdm.asyncio import tqdm as async_tqdm
+from tqdm import tqdm
 
 from config import Config
 from colors import Colors
@@ -15,6 +16,10 @@ from models import ChapterInfo
 from api_client import MangaAPIClient
 from metadata import MetadataGenerator
 
+_SANITIZE_RE = re.compile(r'[\\/*?:"<>|]')
+_CLEAN_PAREN_RE = re.compile(r'\s*\([^)]*\d[^)]*\)')
+_CLEAN_DIGITS_RE = re.compile(r'\d+')
+
 
 class ChapterDownloader:
     def __init__(self, cfg: Config):
@@ -24,9 +29,7 @@ class ChapterDownloader:
 
     @staticmethod
     def sanitize_filename(text: str) -> str:
-        text = text.strip()
-        text = re.sub(r'[\\/*?:"<>|]', '_', text)
-        return text[:200]
+        return _SANITIZE_RE.sub('_', text.strip())[:200]
 
     @staticmethod
     def build_image_url(path: str, host: str) -> str:
@@ -46,20 +49,30 @@ class ChapterDownloader:
 
     @staticmethod
     def clean_chapter_name(name: str) -> str:
-        name = re.sub(r'\s*\([^)]*\d[^)]*\)', '', name).strip()
-        name = re.sub(r'\d+', '', name).strip()
+        name = _CLEAN_PAREN_RE.sub('', name).strip()
+        name = _CLEAN_DIGITS_RE.sub('', name).strip()
         return name
 
-    async def download_chapter(self, api: MangaAPIClient, chapter_num: int) -> Optional[Tuple[Path, ChapterInfo]]:
+    async def download_chapter(self, api: MangaAPIClient, chapter_num: int,
+                               chapters_map: Dict[float, int],
+                               series_title: str) -> Optional[Tuple[Path, ChapterInfo]]:
         tmp_dir = self.cfg.output_dir / f"_tmp_ch{chapter_num}_{int(time.time())}"
         tmp_dir.mkdir(parents=True, exist_ok=True)
 
         try:
-            volume = await api.resolve_volume(self.cfg.manga_slug, chapter_num)
-            
-            chapter_json = await api.fetch_chapter_data(
-                self.cfg.manga_slug, chapter_num, volume
-            )
+            chapter_json = None
+            volume = self.cfg.volume_override
+            if volume is None:
+                volume = chapters_map.get(float(chapter_num))
+            if volume is None:
+                volume, chapter_json = await api.resolve_volume(
+                    self.cfg.manga_slug, chapter_num
+                )
+
+            if chapter_json is None:
+                chapter_json = await api.fetch_chapter_data(
+                    self.cfg.manga_slug, chapter_num, volume
+                )
             data = chapter_json.get("data", {})
 
             if not isinstance(data, dict):
@@ -69,8 +82,6 @@ class ChapterDownloader:
             if not pages:
                 raise ValueError("No pages found")
 
-            series_title = await self._get_series_title(api, data)
-
             chapter_name = self.clean_chapter_name(str(data.get("name") or "").strip())
 
             teams = [
@@ -114,15 +125,6 @@ class ChapterDownloader:
                 shutil.rmtree(tmp_dir, ignore_errors=True)
             return None
 
-    async def _get_series_title(self, api: MangaAPIClient, chapter_data: dict) -> str:
-        if self.cfg.series_title_override:
-            return self.cfg.series_title_override
-
-        meta = await api.fetch_series_info(self.cfg.manga_slug)
-        raw_title = (meta.get("name") or meta.get("title") or 
-                    chapter_data.get("manga_id") or "Unknown")
-        return str(raw_title).strip()
-
     async def _download_images(self, api: MangaAPIClient, urls: List[str], 
                                tmp_dir: Path, chapter_num: int):
         sem = asyncio.Semaphore(self.cfg.max_concurrent_images)
@@ -133,12 +135,27 @@ class ChapterDownloader:
                 filename = f"{idx:03d}{ext}"
                 await api.download_image(url, tmp_dir / filename)
 
-        tasks = [download_task(i + 1, url) for i, url in enumerate(urls)]
-        await async_tqdm.gather(
-            *tasks, 
-            desc=f"  Downloading Ch{chapter_num}", 
-            unit="img"
+        tasks = [
+            asyncio.create_task(download_task(i + 1, url))
+            for i, url in enumerate(urls)
+        ]
+        bar = tqdm(
+            total=len(tasks),
+            desc=f"  Downloading Ch{chapter_num}",
+            unit="img",
+            mininterval=0.2,
+            miniters=max(1, len(tasks) // 20)
         )
+        try:
+            for task in asyncio.as_completed(tasks):
+                await task
+                bar.update(1)
+        finally:
+            # Не оставляем задачи писать в tmp_dir, который вызывающий удалит
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            bar.close()
 
     def create_cbz(self, tmp_dir: Path, info: ChapterInfo, cbz_path: Path):
         final_series_title = info.series_title or self.cfg.manga_slug
@@ -156,13 +173,22 @@ class ChapterDownloader:
 
         comicinfo_xml = self.metadata_gen.create_chapter_comicinfo(info)
 
-        with zipfile.ZipFile(cbz_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("info.txt", json.dumps(meta, ensure_ascii=False, indent=2))
-            zf.writestr("ComicInfo.xml", comicinfo_xml)
-            
-            for file in sorted(tmp_dir.iterdir()):
-                if file.is_file():
-                    zf.write(file, arcname=file.name)
+        # Изображения уже сжаты, поэтому deflate применяется только к метаданным
+        with zipfile.ZipFile(cbz_path, "w", zipfile.ZIP_STORED) as zf:
+            zf.writestr(
+                "info.txt",
+                json.dumps(meta, ensure_ascii=False, indent=2),
+                compress_type=zipfile.ZIP_DEFLATED
+            )
+            zf.writestr("ComicInfo.xml", comicinfo_xml, compress_type=zipfile.ZIP_DEFLATED)
+
+            with os.scandir(tmp_dir) as it:
+                entries = sorted(
+                    (e for e in it if e.is_file(follow_symlinks=False)),
+                    key=lambda e: e.name
+                )
+            for entry in entries:
+                zf.write(entry.path, arcname=entry.name)
 
     async def download_chapters(self, chapter_range: Tuple[int, int]) -> List[Path]:
         start, end = chapter_range
@@ -171,25 +197,26 @@ class ChapterDownloader:
         self._print_header(start, end, len(chapters))
 
         async with MangaAPIClient(self.cfg) as api:
-            try:
-                await api.fetch_chapters_list(self.cfg.manga_slug)
-            except Exception:
-                pass
-
-            series_meta = await api.fetch_series_info(self.cfg.manga_slug)
+            chapters_map, series_meta = await asyncio.gather(
+                api.fetch_chapters_list(self.cfg.manga_slug),
+                api.fetch_series_info(self.cfg.manga_slug)
+            )
             series_title = self._determine_series_title(series_meta)
 
-            results = await self._download_all_chapters(api, chapters)
+            results = await self._download_all_chapters(
+                api, chapters, chapters_map, series_title
+            )
 
-        successful, failed_count = self._process_results(chapters, results)
+            successful, failed_count = self._process_results(chapters, results)
 
-        if not successful:
-            print(Colors.error("No chapters downloaded successfully"))
-            return []
+            if not successful:
+                print(Colors.error("No chapters downloaded successfully"))
+                return []
 
-        zip_path = await self._create_series_archive(
-            successful, series_title, series_meta, api
-        )
+            # Обложка скачивается через api, поэтому сессия ещё должна быть открыта
+            zip_path = await self._create_series_archive(
+                successful, series_title, series_meta, api
+            )
 
         self._print_summary(len(successful), len(chapters), failed_count)
 
@@ -212,12 +239,13 @@ class ChapterDownloader:
                 series_meta.get("eng_name") or 
                 self.cfg.manga_slug)
 
-    async def _download_all_chapters(self, api: MangaAPIClient, chapters: List[int]) -> list:
+    async def _download_all_chapters(self, api: MangaAPIClient, chapters: List[int],
+                                     chapters_map: Dict[float, int], series_title: str) -> list:
         sem = asyncio.Semaphore(self.cfg.max_concurrent_chapters)
 
         async def download_with_limit(ch: int):
             async with sem:
-                return await self.download_chapter(api, ch)
+                return await self.download_chapter(api, ch, chapters_map, series_title)
 
         return await asyncio.gather(
             *[download_with_limit(ch) for ch in chapters],
@@ -254,9 +282,9 @@ class ChapterDownloader:
 
         self._create_series_metadata(series_folder, series_title, series_meta)
 
-        self._process_volumes(volume_groups, series_folder, series_title, series_meta)
+        await self._process_volumes(volume_groups, series_folder, series_title, series_meta)
 
-        zip_path = self._create_final_archive(temp_series_dir, sanitized_series)
+        zip_path = await self._create_final_archive(temp_series_dir, sanitized_series)
 
         self._cleanup(successful, temp_series_dir)
 
@@ -274,11 +302,21 @@ class ChapterDownloader:
             "poster.jpg", "thumbnail.jpg"
         ]
         
-        for name in cover_names:
+        main_cover = series_folder / cover_names[0]
+        try:
+            await api.download_image(cover_url, main_cover)
+        except Exception as e:
+            print(Colors.warning(f"Failed to download cover '{cover_names[0]}': {e}"))
+            return
+
+        for name in cover_names[1:]:
             try:
-                await api.download_image(cover_url, series_folder / name)
-            except Exception as e:
-                print(Colors.warning(f"Failed to download cover '{name}': {e}"))
+                os.link(main_cover, series_folder / name)
+            except OSError:
+                try:
+                    shutil.copyfile(main_cover, series_folder / name)
+                except OSError as e:
+                    print(Colors.warning(f"Failed to copy cover '{name}': {e}"))
 
     def _create_series_metadata(self, series_folder: Path, series_title: str, series_meta: dict):
         
@@ -292,7 +330,7 @@ class ChapterDownloader:
         )
         (series_folder / "series.json").write_text(series_json, encoding="utf-8")
 
-    def _process_volumes(self, volume_groups: dict, series_folder: Path, series_title: str, series_meta: dict):
+    async def _process_volumes(self, volume_groups: dict, series_folder: Path, series_title: str, series_meta: dict):
         if self.cfg.group_by_volume:
             for volume in sorted(volume_groups):
                 chapter_list = sorted(volume_groups[volume], key=lambda x: x[1].number)
@@ -302,8 +340,20 @@ class ChapterDownloader:
                 vol_folder = series_folder / sanitized_vol
                 vol_folder.mkdir(exist_ok=True)
 
+                chapter_count = len(chapter_list)
+                if not self.cfg.emit_series_zip:
+                    # Папка серии будет объединена с существующей — учитываем уже скачанные главы
+                    existing_vol = self.cfg.output_dir / series_folder.name / sanitized_vol
+                    chapter_names = {
+                        f"{self.sanitize_filename(f'Chapter {info.number:03d}')}.cbz"
+                        for _, info in chapter_list
+                    }
+                    if existing_vol.is_dir():
+                        chapter_names.update(p.name for p in existing_vol.glob("*.cbz"))
+                    chapter_count = len(chapter_names)
+
                 vol_xml = self.metadata_gen.create_volume_comicinfo(
-                    volume, series_title, len(chapter_list), series_meta
+                    volume, series_title, chapter_count, series_meta
                 )
                 (vol_folder / "ComicInfo.xml").write_bytes(vol_xml)
 
@@ -311,7 +361,7 @@ class ChapterDownloader:
                     chap_name = f"Chapter {info.number:03d}"
                     sanitized_chap = self.sanitize_filename(chap_name)
                     cbz_path = vol_folder / f"{sanitized_chap}.cbz"
-                    self.create_cbz(tmp_dir, info, cbz_path)
+                    await asyncio.to_thread(self.create_cbz, tmp_dir, info, cbz_path)
         else:
             all_chapters = []
             for volume in sorted(volume_groups):
@@ -322,15 +372,42 @@ class ChapterDownloader:
                 chap_name = f"Chapter {info.number:03d}"
                 sanitized_chap = self.sanitize_filename(chap_name)
                 cbz_path = series_folder / f"{sanitized_chap}.cbz"
-                self.create_cbz(tmp_dir, info, cbz_path)
+                await asyncio.to_thread(self.create_cbz, tmp_dir, info, cbz_path)
 
-    def _create_final_archive(self, temp_series_dir: Path, sanitized_series: str) -> Path:
-        zip_base = self.cfg.output_dir / sanitized_series
-        shutil.make_archive(str(zip_base), 'zip', str(temp_series_dir))
-        zip_path = zip_base.with_suffix('.zip')
+    async def _create_final_archive(self, temp_series_dir: Path, sanitized_series: str) -> Path:
+        if not self.cfg.emit_series_zip:
+            series_path = self.cfg.output_dir / sanitized_series
+            self._merge_directory(temp_series_dir / sanitized_series, series_path)
+            print(Colors.success(f"Saved series folder: {series_path.name}"))
+            return series_path
+
+        zip_path = self.cfg.output_dir / f"{sanitized_series}.zip"
+        await asyncio.to_thread(self._zip_directory, temp_series_dir, zip_path)
         print(Colors.success(f"Saved archive: {zip_path.name}"))
         return zip_path
 
+    @staticmethod
+    def _merge_directory(src_dir: Path, dst_dir: Path):
+        # Существующая папка серии сохраняется: новые файлы добавляются,
+        # одноимённые (главы, метаданные) заменяются
+        if not dst_dir.exists():
+            shutil.move(str(src_dir), str(dst_dir))
+            return
+
+        for root, _, files in os.walk(src_dir):
+            target_root = dst_dir / os.path.relpath(root, src_dir)
+            target_root.mkdir(parents=True, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(root, name), target_root / name)
+
+    @staticmethod
+    def _zip_directory(src_dir: Path, zip_path: Path):
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for root, _, files in os.walk(src_dir):
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    zf.write(full, arcname=os.path.relpath(full, src_dir))
+
     def _cleanup(self, successful: list, temp_series_dir: Path):
         if not self.cfg.cleanup_temp:
             return
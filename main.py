@@ -15,7 +15,7 @@ async def main():
         # Параметры производительности
         max_concurrent_chapters=2,  # рекомендуется: 1-5
         max_concurrent_images=3,    # рекомендуется: 2-10
-        request_delay=2,          # рекомендуется: 0.5-5
+        request_delay=0.4,        # общий интервал между запросами, рекомендуется: 0.2-1
         
         # Дополнительные параметры
         output_dir=Path("downloads"),
@@ -24,6 +24,9 @@ async def main():
 
         # если False — НЕ распределять по томам (все главы в одной папке архива)
         group_by_volume=False,
+
+        # если True — упаковать папку серии в один .zip (CBZ внутри уже сжаты)
+        emit_series_zip=False,
     )
     # ========== КОНФИГУРАЦИЯ ==========
 
@@ -32,4 +35,9 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file